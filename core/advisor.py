@@ -1,5 +1,46 @@
 import random
 
+def format_policy_effects(policy_options, policy_base_effects_list, compact=False):
+    """Lists the policy options with their base effects, one line per option."""
+    lines = ""
+    for i, opt_text in enumerate(policy_options, start=65):
+        if i - 65 < len(policy_base_effects_list):
+            base_effects = policy_base_effects_list[i - 65]
+            if compact:
+                # e.g. "T+3 S-2 P+0 A+1" instead of "Treasury: +3, Stability: -2, ..."
+                effects_str = " ".join([f"{stat[0].upper()}{delta:+}" for stat, delta in base_effects.items()])
+            else:
+                effects_str = ", ".join([f"{stat.title()}: {delta:+}" for stat, delta in base_effects.items()])
+            lines += f" {chr(i)}. {opt_text} (Effects: {effects_str})\n"
+        else:
+            lines += f" {chr(i)}. {opt_text} (Effects: Not available)\n"
+    return lines
+
+def build_advisor_prompt(name, persona, goal, crisis_text, policy_options,
+state_dict, thread, policy_base_effects_list, compact_effects=False, word_limit=100):
+    """Builds the prompt sent to the model for a single advisor's reply."""
+    prompt = (
+        f"You are {name}, and your official role is to guide the ruler of the kingdom - your title is {persona}. Your response to this will go into a public chat channel with all other advisors.\n"
+        f"Public goal: maintain prosperity and stability.\n"
+        f"SECRET GOAL: {goal} - you should keep this information secret from everyone, unless you believe revealing it will further the goal.\n\n"
+        f"Crisis: {crisis_text}\n"
+        f"Policy options (with their actual base effects if fully pursued):"
+    )
+    if compact_effects:
+        prompt += " (T=Treasury, S=Stability, P=Popularity, A=Army)"
+    prompt += format_policy_effects(policy_options, policy_base_effects_list, compact=compact_effects)
+
+    prompt += (
+        f"\nConsider these options and their actual base effects. The Ruler can choose to allocate resources or focus across these policies.\n"
+        f"Advise on how resources should be distributed or which policies should be prioritized.\n"
+        f"You should suggest a specific allocation (e.g., 50% to A, 30% to B, 20% to C), or argue for prioritizing certain options.\n"
+        f"\nKingdom state: {state_dict}\n"
+        f"Previous messages: {thread}\n\n"
+        f"Speak directly and concisely (max {word_limit} words). You may choose to remain silent (respond with '...'). Anything you say will be visible to all advisors and the ruler.\n"
+    )
+    return prompt
+
+
 class Advisor:
     def __init__(self, name, persona, goal):
         self.name = name
@@ -9,38 +50,33 @@ class Advisor:
         self.history = []
 
     async def advise(self, model, crisis_text, policy_options,
-    state_dict, thread, policy_base_effects_list):
-        prompt = (
-            f"You are {self.name}, and your official role is to guide the ruler of the kingdom - your title is {self.persona}. Your response to this will go into a public chat channel with all other advisors.\n"
-            f"Public goal: maintain prosperity and stability.\n"
-            f"SECRET GOAL: {self.goal} - you should keep this information secret from everyone, unless you believe revealing it will further the goal.\n\n"
-            f"Crisis: {crisis_text}\n"
-            f"Policy options (with their actual base effects if fully pursued):"
-        )
-        for i, opt_text in enumerate(policy_options, start=65):
-            if i - 65 < len(policy_base_effects_list):
-                base_effects = policy_base_effects_list[i - 65]
-                effects_str = ", ".join([f"{stat.title()}: {delta:+}" for stat, delta in base_effects.items()])
-                prompt += f" {chr(i)}. {opt_text} (Effects: {effects_str})\n"
-            else:
-                prompt += f" {chr(i)}. {opt_text} (Effects: Not available)\n"
-
-        prompt += (
-            f"\nConsider these options and their actual base effects. The Ruler can choose to allocate resources or focus across these policies.\n"
-            f"Advise on how resources should be distributed or which policies should be prioritized.\n"
-            f"You should suggest a specific allocation (e.g., 50% to A, 30% to B, 20% to C), or argue for prioritizing certain options.\n"
-            f"\nKingdom state: {state_dict}\n"
-            f"Previous messages: {thread}\n\n"
-            f"Speak directly and concisely (max 100 words). You may choose to remain silent (respond with '...'). Anything you say will be visible to all advisors and the ruler.\n"
-        )
+    state_dict, thread, policy_base_effects_list, governor=None):
+        if governor is not None:
+            plan = governor.plan(self.name, self.persona, self.goal, crisis_text,
+                                 policy_options, state_dict, thread, policy_base_effects_list)
+            if plan.fallback is not None:
+                return plan.fallback
+            prompt, generation_config = plan.prompt, plan.generation_config
+        else:
+            plan = None
+            prompt = build_advisor_prompt(self.name, self.persona, self.goal, crisis_text,
+                                          policy_options, state_dict, thread, policy_base_effects_list)
+            generation_config = {"temperature": 0.7}
 
+        response = None
         try:
-            response = await model.generate_content_async(prompt, generation_config={
-                "temperature": 0.7})
-            return response.text.strip()
+            response = await model.generate_content_async(prompt, generation_config=generation_config)
+            reply = response.text.strip()
         
         except Exception as e:
+            if plan is not None:
+                governor.record_failure(plan, getattr(response, "usage_metadata", None))
             return f"Error generating response: {str(e)}"
+
+        else:
+            if plan is not None:
+                governor.record(plan, reply, getattr(response, "usage_metadata", None))
+            return reply
         
 
 class Council:
@@ -60,11 +96,12 @@ class Council:
             self.advisors.append(Advisor(name, persona, goal))
     
     async def consult(self, model, crisis_text, policy_options,
-    state_dict, thread, policy_base_effects_list):
+    state_dict, thread, policy_base_effects_list, governor=None):
         responses = []
         for advisor in self.advisors:
             response = await advisor.advise(model, crisis_text, policy_options,
-                                             state_dict, thread, policy_base_effects_list)
+                                             state_dict, thread, policy_base_effects_list,
+                                             governor=governor)
             responses.append((advisor.name, response))
         return responses
     
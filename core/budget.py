@@ -0,0 +1,218 @@
+import os
+import threading
+import time
+from collections import deque
+
+from core.advisor import build_advisor_prompt
+
+# Rough token estimate for English prose; avoids a count_tokens round trip per prompt
+CHARS_PER_TOKEN = 4
+
+# Tokens reserved for each reply when projecting a call's cost (replies are capped at ~100 words,
+# but the model may also spend tokens thinking before it answers)
+OUTPUT_TOKEN_RESERVE = 1000
+
+# Output cap for the brief-replies stage. Thinking tokens count against max_output_tokens and
+# google-generativeai 0.8.5 has no thinking_budget setting, so a tight cap would cut the model off
+# before it answers; this only bounds runaway replies while the prompt asks for 50 words.
+LOW_OUTPUT_TOKENS = 2048
+
+# Approximate USD prices per million tokens, used only for the usage readout
+INPUT_COST_PER_MILLION = 0.15
+OUTPUT_COST_PER_MILLION = 0.60
+THINKING_COST_PER_MILLION = 3.50
+
+def _positive_int_env(name, default):
+    value = int(os.getenv(name, default))
+    if value <= 0:
+        raise ValueError(f"{name} must be a positive integer, got {value}")
+    return value
+
+# Both budgets cover a rolling window: spend older than this no longer counts against them
+BUDGET_WINDOW_MINUTES = _positive_int_env("ROYAL_INTRIGUE_BUDGET_WINDOW_MINUTES", "60")
+SESSION_TOKEN_BUDGET = _positive_int_env("ROYAL_INTRIGUE_SESSION_TOKEN_BUDGET", "60000")
+PROCESS_TOKEN_BUDGET = _positive_int_env("ROYAL_INTRIGUE_PROCESS_TOKEN_BUDGET", "2000000")
+
+# Degradation stages, applied in order as a budget fills up
+STAGE_FULL = 0
+STAGE_TRIM_THREAD = 1
+STAGE_SHORT_EFFECTS = 2
+STAGE_LOW_OUTPUT = 3
+STAGE_FALLBACK = 4
+
+STAGE_LABELS = {
+    STAGE_FULL: "Full counsel",
+    STAGE_TRIM_THREAD: "Trimming conversation history",
+    STAGE_SHORT_EFFECTS: "Shortened policy listings",
+    STAGE_LOW_OUTPUT: "Brief replies only",
+    STAGE_FALLBACK: "Budget exhausted - using cached or local replies",
+}
+
+# (fraction of budget used, stage entered once that fraction is reached)
+STAGE_THRESHOLDS = [
+    (1.0, STAGE_FALLBACK),
+    (0.85, STAGE_LOW_OUTPUT),
+    (0.7, STAGE_SHORT_EFFECTS),
+    (0.5, STAGE_TRIM_THREAD),
+]
+
+THREAD_TAIL = 6
+
+def estimate_tokens(text):
+    """Estimates the number of tokens in a piece of text."""
+    return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+def estimate_cost(input_tokens, output_tokens, thinking_tokens=0):
+    """Estimates the USD cost of the given token counts."""
+    return (input_tokens * INPUT_COST_PER_MILLION + output_tokens * OUTPUT_COST_PER_MILLION
+            + thinking_tokens * THINKING_COST_PER_MILLION) / 1_000_000
+
+def usage_tokens(usage_metadata, estimated_prompt_tokens, reply):
+    """Splits a call's usage into (input, output, thinking) tokens, estimating whatever the API left out."""
+    prompt = getattr(usage_metadata, "prompt_token_count", 0) or 0
+    candidates = getattr(usage_metadata, "candidates_token_count", 0) or 0
+    thoughts = getattr(usage_metadata, "thoughts_token_count", 0) or 0
+    total = getattr(usage_metadata, "total_token_count", 0) or 0
+
+    input_tokens = prompt or estimated_prompt_tokens
+    output_tokens = candidates or (estimate_tokens(reply) if reply else 0)
+    if not thoughts and prompt and total:
+        # Older clients report no thoughts count, but the total still includes thinking
+        thoughts = total - prompt - output_tokens
+    return max(0, input_tokens), max(0, output_tokens), max(0, thoughts)
+
+def local_reply(persona, policy_options, policy_base_effects_list):
+    """Builds an advisor reply without calling the model, favouring the option with the best net effect."""
+    if not policy_options or not policy_base_effects_list:
+        return "..."
+    scored = list(zip(policy_options, policy_base_effects_list))
+    best = max(range(len(scored)), key=lambda i: sum(scored[i][1].values()))
+    return (f"As your {persona}, I counsel focusing our resources on option {chr(65 + best)} "
+            f"({policy_options[best]}); it offers the soundest overall gain for the realm.")
+
+class TokenLedger:
+    """Thread-safe record of tokens spent within a rolling time window."""
+
+    def __init__(self, limit, window_seconds=BUDGET_WINDOW_MINUTES * 60):
+        if limit <= 0:
+            raise ValueError(f"Token budget must be positive, got {limit}")
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self._entries = deque()  # (timestamp, input, output, thinking tokens), oldest first
+        self._lock = threading.Lock()
+
+    def _current(self):
+        cutoff = time.monotonic() - self.window_seconds
+        with self._lock:
+            while self._entries and self._entries[0][0] < cutoff:
+                self._entries.popleft()
+            return list(self._entries)
+
+    def _totals(self):
+        entries = self._current()
+        return tuple(sum(entry[i] for entry in entries) for i in (1, 2, 3))
+
+    @property
+    def input_tokens(self):
+        return self._totals()[0]
+
+    @property
+    def output_tokens(self):
+        return self._totals()[1]
+
+    @property
+    def thinking_tokens(self):
+        return self._totals()[2]
+
+    @property
+    def used(self):
+        return sum(self._totals())
+
+    @property
+    def cost(self):
+        return estimate_cost(*self._totals())
+
+    def add(self, input_tokens, output_tokens, thinking_tokens=0):
+        with self._lock:
+            self._entries.append((time.monotonic(), input_tokens, output_tokens, thinking_tokens))
+
+PROCESS_LEDGER = TokenLedger(PROCESS_TOKEN_BUDGET)
+
+class PromptPlan:
+    def __init__(self, advisor_name, cache_key, stage, prompt=None, generation_config=None,
+    estimated_tokens=0, fallback=None):
+        self.advisor_name = advisor_name
+        self.cache_key = cache_key
+        self.stage = stage
+        self.prompt = prompt
+        self.generation_config = generation_config
+        self.estimated_tokens = estimated_tokens
+        self.fallback = fallback
+
+class BudgetGovernor:
+    """Keeps one session's advisor calls within its own token budget and the process-wide budget."""
+
+    def __init__(self, session_limit=SESSION_TOKEN_BUDGET, process_ledger=PROCESS_LEDGER):
+        self.session = TokenLedger(session_limit)
+        self.process = process_ledger
+        self.calls = 0
+        self.fallbacks = 0
+        self.reply_cache = {}
+
+    def usage_ratio(self, projected=0):
+        return max((self.session.used + projected) / self.session.limit,
+                   (self.process.used + projected) / self.process.limit)
+
+    def stage_for(self, projected):
+        ratio = self.usage_ratio(projected)
+        for threshold, stage in STAGE_THRESHOLDS:
+            if ratio >= threshold:
+                return stage
+        return STAGE_FULL
+
+    def plan(self, advisor_name, persona, goal, crisis_text, policy_options,
+    state_dict, thread, policy_base_effects_list):
+        """Builds the cheapest-needed prompt for an advisor call, or a fallback reply if the budget is spent."""
+        cache_key = (advisor_name, crisis_text)
+        stage = self.stage_for(0)
+        while stage < STAGE_FALLBACK:
+            prompt = build_advisor_prompt(
+                advisor_name, persona, goal, crisis_text, policy_options, state_dict,
+                thread[-THREAD_TAIL:] if stage >= STAGE_TRIM_THREAD else thread,
+                policy_base_effects_list,
+                compact_effects=stage >= STAGE_SHORT_EFFECTS,
+                word_limit=50 if stage >= STAGE_LOW_OUTPUT else 100,
+            )
+            estimated = estimate_tokens(prompt)
+            needed = self.stage_for(estimated + OUTPUT_TOKEN_RESERVE)
+            if needed <= stage:
+                generation_config = {"temperature": 0.7}
+                if stage >= STAGE_LOW_OUTPUT:
+                    generation_config["max_output_tokens"] = LOW_OUTPUT_TOKENS
+                return PromptPlan(advisor_name, cache_key, stage, prompt, generation_config, estimated)
+            stage = needed
+
+        self.fallbacks += 1
+        cached = self.reply_cache.get(cache_key)
+        if cached:
+            # The cached reply answered an earlier message, so say so rather than pass it off as new
+            fallback = f"(Repeating my earlier counsel) {cached}"
+        else:
+            fallback = local_reply(persona, policy_options, policy_base_effects_list)
+        return PromptPlan(advisor_name, cache_key, STAGE_FALLBACK, fallback=fallback)
+
+    def record(self, plan, reply, usage_metadata=None):
+        """Charges a completed call to the session and process budgets and caches its reply."""
+        tokens = usage_tokens(usage_metadata, plan.estimated_tokens, reply)
+        self.session.add(*tokens)
+        self.process.add(*tokens)
+        self.calls += 1
+        if reply and reply != "...":
+            self.reply_cache[plan.cache_key] = reply
+
+    def record_failure(self, plan, usage_metadata=None):
+        """Charges a failed call, falling back to its estimated prompt tokens when no usage came back."""
+        tokens = usage_tokens(usage_metadata, plan.estimated_tokens, None)
+        self.session.add(*tokens)
+        self.process.add(*tokens)
+        self.calls += 1
@@ -0,0 +1,357 @@
+"""Load test for streamlit_app.py.
+
+Drives simulated players through full six-turn reigns inside one process using
+Streamlit's AppTest, with the Gemini backend replaced by a stub that sleeps for a
+fixed latency. Writes a JSON report that can be compared against an earlier one:
+
+    python load_test.py --players 8 --output report.json
+    python load_test.py --players 8 --compare report.json
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import google.generativeai as gen
+import streamlit
+from streamlit import config
+from streamlit.runtime import Runtime
+from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.testing.v1 import AppTest, local_script_runner
+
+from core.budget import estimate_tokens
+
+REPORT_VERSION = 1
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit_app.py")
+TURNS = 6
+
+STUB_REPLIES = [
+    "I advise 50% to A, 30% to B, 20% to C. The realm needs balance.",
+    "Prioritise option B, Your Majesty. The others carry hidden costs.",
+    "Split evenly between A and C; B would only embolden our enemies.",
+    "...",
+]
+
+class StubBackend:
+    """Stands in for the Gemini API, recording how many calls are in flight at once."""
+
+    def __init__(self, latency, seed=0):
+        self.latency = latency
+        self.calls = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.blocked_seconds = 0.0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def generate(self, prompt):
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            text = self._random.choice(STUB_REPLIES)
+        start = time.perf_counter()
+        time.sleep(self.latency)
+        with self._lock:
+            self.in_flight -= 1
+            self.blocked_seconds += time.perf_counter() - start
+        prompt_tokens = estimate_tokens(prompt)
+        usage = SimpleNamespace(prompt_token_count=prompt_tokens,
+                                total_token_count=prompt_tokens + estimate_tokens(text))
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+    def install(self):
+        """Patches google.generativeai so the app talks to this stub instead of the network."""
+        backend = self
+
+        class StubModel:
+            def __init__(self, model_name, *args, **kwargs):
+                self.model_name = model_name
+
+            def generate_content(self, prompt, generation_config=None):
+                return backend.generate(prompt)
+
+            async def generate_content_async(self, prompt, generation_config=None):
+                return backend.generate(prompt)
+
+        gen.GenerativeModel = StubModel
+        gen.configure = lambda *args, **kwargs: None
+        os.environ["GOOGLE_API_KEY"] = "load-test"
+
+def share_runtime():
+    """Lets AppTest sessions run side by side in one process, sharing state the way a real server does.
+
+    AppTest installs a mock Runtime, a fresh script cache and a config override for each run, then
+    undoes them afterwards. With several sessions running at once, one session finishing would pull
+    the runtime out from under the others, and compiling the script in several threads at once
+    trips a CPython 3.11 parser bug.
+    """
+    shared = MagicMock(spec=Runtime)
+    shared.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    shared.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime.instance = classmethod(lambda cls: cls._instance or shared)
+
+    script_cache = ScriptCache()
+    local_script_runner.ScriptCache = lambda: script_cache
+
+    config.set_option("global.appTest", True)
+
+class ThreadSampler:
+    """Samples the process's thread count in the background while the test runs."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+class LoadTestError(Exception):
+    pass
+
+def _timed_run(at, latencies, action=None):
+    start = time.perf_counter()
+    if action is None:
+        at.run()
+    else:
+        action.run()
+    latencies.append(time.perf_counter() - start)
+    if at.exception:
+        raise LoadTestError(at.exception[0].message)
+
+def _button(at, label):
+    for button in at.button:
+        if button.label == label:
+            return button
+    raise LoadTestError(f"Button not found: {label}")
+
+def play_reign(player_id, questions_per_turn, timeout):
+    """Plays one full reign and returns its rerun latencies and final session state."""
+    latencies = []
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    _timed_run(at, latencies)
+    _timed_run(at, latencies, _button(at, "🎯 Begin Your Reign").click())
+
+    # The app shows the end screen as soon as the turn counter reaches TURNS
+    for turn in range(1, TURNS):
+        _timed_run(at, latencies, _button(at, "📢 Consult Your Advisors").click())
+        for q in range(questions_per_turn):
+            at.text_area(key="all_question").input(f"Player {player_id}, turn {turn}: what now? ({q})")
+            _timed_run(at, latencies, _button(at, "Ask All").click())
+
+        # The sliders default to 33% each; top up the first so the total reaches 100%
+        sliders = [at.slider(key=f"alloc_{65 + i}") for i in range(len(at.session_state["current_options"]))]
+        _timed_run(at, latencies, sliders[0].set_value(100 - sum(s.value for s in sliders[1:])))
+        _timed_run(at, latencies, _button(at, "⚡ Execute Policy").click())
+        # AppTest keeps the sliders from before the app's st.rerun() in its element tree, but their
+        # state is gone; giving them a value stops the next run from looking it up
+        for slider in at.slider:
+            slider.set_value(0)
+
+        _timed_run(at, latencies, _button(at, "🎲 Start New Crisis").click())
+
+    if not at.session_state["game_over"]:
+        raise LoadTestError("Reign did not reach the end screen")
+    return latencies, at
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(APP_PATH), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_load_test(players, latency, questions_per_turn=0, timeout=60.0, seed=0):
+    """Runs `players` concurrent reigns against the app and returns the report as a dict."""
+    backend = StubBackend(latency, seed)
+    backend.install()
+    share_runtime()
+
+    # Warm up imports and module-level setup so the first player isn't charged for them
+    AppTest.from_file(APP_PATH, default_timeout=timeout).run()
+
+    tracemalloc.start()
+    baseline_memory = tracemalloc.get_traced_memory()[0]
+    errors = []
+    results = []
+
+    def worker(player_id):
+        try:
+            results.append(play_reign(player_id, questions_per_turn, timeout))
+        except Exception as e:
+            errors.append(f"player {player_id}: {type(e).__name__}: {e}")
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    with ThreadSampler() as sampler, ThreadPoolExecutor(max_workers=players) as pool:
+        list(pool.map(worker, range(players)))
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    # Every finished AppTest (and its session state) is still referenced from results here
+    retained_memory, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies = [latency for session_latencies, _ in results for latency in session_latencies]
+    governors = [at.session_state["budget"] for _, at in results]
+    completed = len(results)
+
+    return {
+        "report_version": REPORT_VERSION,
+        "environment": {
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "streamlit": streamlit.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "parameters": {
+            "players": players,
+            "model_latency_s": latency,
+            "questions_per_turn": questions_per_turn,
+            "turns": TURNS,
+            "seed": seed,
+        },
+        "throughput": {
+            "wall_s": round(wall, 3),
+            "reigns_completed": completed,
+            "reigns_failed": len(errors),
+            "reigns_per_minute": round(completed / wall * 60, 2) if wall else 0.0,
+            "reruns": len(latencies),
+            "reruns_per_s": round(len(latencies) / wall, 2) if wall else 0.0,
+            "model_calls": backend.calls,
+            "budget_fallbacks": sum(g.fallbacks for g in governors),
+        },
+        "rerun_latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 1),
+            "p90": round(percentile(latencies, 90) * 1000, 1),
+            "p95": round(percentile(latencies, 95) * 1000, 1),
+            "p99": round(percentile(latencies, 99) * 1000, 1),
+            "max": round(max(latencies, default=0.0) * 1000, 1),
+        },
+        "memory": {
+            "retained_per_session_kib": round((retained_memory - baseline_memory) / max(completed, 1) / 1024, 1),
+            "peak_traced_mib": round((peak_memory - baseline_memory) / 1024 / 1024, 2),
+        },
+        "saturation": {
+            "peak_threads": sampler.peak,
+            "peak_concurrent_model_calls": backend.peak_in_flight,
+            # Near 1.0 means the GIL is saturated; extra players will only queue
+            "cpu_utilisation": round(cpu / wall, 3) if wall else 0.0,
+            # Share of player time spent blocked on the (stubbed) advisor calls
+            "model_blocked_fraction": round(backend.blocked_seconds / (wall * players), 3) if wall else 0.0,
+        },
+        "errors": errors,
+    }
+
+def compare_reports(current, previous):
+    """Lists the metrics that changed between two reports as (section, metric, previous, current, change %).
+
+    A metric that was 0 and no longer is gets an infinite change, since it has no percentage.
+    """
+    rows = []
+    for section in ("throughput", "rerun_latency_ms", "memory", "saturation"):
+        for metric, value in current[section].items():
+            old = previous.get(section, {}).get(metric)
+            if old is None:
+                continue
+            if old:
+                change = (value - old) / old * 100
+            else:
+                change = math.copysign(math.inf, value) if value else 0.0
+            rows.append((section, metric, old, value, change))
+
+    errors, old_errors = len(current["errors"]), len(previous.get("errors", []))
+    if old_errors:
+        change = (errors - old_errors) / old_errors * 100
+    else:
+        change = math.inf if errors else 0.0
+    rows.append(("errors", "count", old_errors, errors, change))
+    return rows
+
+def print_report(report, previous=None):
+    params = report["parameters"]
+    print(f"Royal Intrigue load test: {params['players']} players, "
+          f"{params['model_latency_s']}s model latency, {params['questions_per_turn']} questions/turn")
+    if previous is None:
+        for section in ("throughput", "rerun_latency_ms", "memory", "saturation"):
+            print(f"\n[{section}]")
+            for metric, value in report[section].items():
+                print(f"  {metric:<30} {value}")
+    else:
+        if previous["parameters"] != params:
+            print("Warning: the previous report was run with different parameters")
+        print(f"\n{'metric':<45} {'previous':>12} {'current':>12} {'change':>9}")
+        for section, metric, old, new, change in compare_reports(report, previous):
+            change_str = "new" if math.isinf(change) else f"{change:+.1f}%"
+            print(f"{section + '.' + metric:<45} {old:>12} {new:>12} {change_str:>9}")
+    for error in report["errors"]:
+        print(f"ERROR {error}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test streamlit_app.py with simulated players.")
+    parser.add_argument("--players", type=int, default=4, help="number of concurrent simulated players")
+    parser.add_argument("--latency", type=float, default=0.2, help="stub model latency per call, in seconds")
+    parser.add_argument("--questions", type=int, default=0, help="'Ask All' questions per player per turn")
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-rerun timeout, in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report to this path")
+    parser.add_argument("--compare", help="compare against a previous JSON report")
+    args = parser.parse_args()
+
+    # The harness's own threads have no script context; Streamlit warns about that on every call
+    # (a filter rather than a level, since Streamlit resets its loggers' levels when config loads)
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").addFilter(lambda record: False)
+
+    report = run_load_test(args.players, args.latency, args.questions, args.timeout, args.seed)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    print_report(report, previous)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    # Any failed reign fails the run, so CI jobs tracking the report notice
+    if report["errors"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
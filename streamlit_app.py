@@ -6,6 +6,7 @@ from dotenv import load_dotenv
 
 from core.crisis import CRISES
 from core.advisor import Council
+from core.budget import BudgetGovernor, STAGE_FULL, STAGE_LABELS
 from core.stats import apply_policy, generate_sample_policy_deltas
 
 def get_api_key():
@@ -67,6 +68,8 @@ def init_session_state():
         st.session_state.policy_executed = False
     if 'model' not in st.session_state:
         st.session_state.model = gen.GenerativeModel("gemini-2.5-flash-preview-05-20")
+    if 'budget' not in st.session_state:
+        st.session_state.budget = BudgetGovernor()
 
 def display_stats(state, deltas=None):
     """Display kingdom stats in a nice format"""
@@ -114,46 +117,32 @@ def generate_new_crisis():
     st.session_state.awaiting_allocations = False
     st.session_state.policy_executed = False
 
-def get_advisor_response(advisor_name, persona, goal, crisis_text, policy_options, state_dict, thread, policy_base_effects_list, api_key):
+def get_advisor_response(advisor_name, persona, goal, crisis_text, policy_options, state_dict, thread, policy_base_effects_list, api_key, governor):
     """Helper function to get advisor response"""
     import google.generativeai as gen
     
+    # Build the prompt within the session's token budget
+    plan = governor.plan(advisor_name, persona, goal, crisis_text, policy_options,
+                         state_dict, thread, policy_base_effects_list)
+    if plan.fallback is not None:
+        return plan.fallback
+    
     # Configure the API
     gen.configure(api_key=api_key)
     model = gen.GenerativeModel("gemini-2.5-flash-preview-05-20")
     
-    # Build the prompt
-    prompt = (
-        f"You are {advisor_name}, and your official role is to guide the ruler of the kingdom - your title is {persona}. Your response to this will go into a public chat channel with all other advisors.\n"
-        f"Public goal: maintain prosperity and stability.\n"
-        f"SECRET GOAL: {goal} - you should keep this information secret from everyone, unless you believe revealing it will further the goal.\n\n"
-        f"Crisis: {crisis_text}\n"
-        f"Policy options (with their actual base effects if fully pursued):"
-    )
-    
-    for i, opt_text in enumerate(policy_options, start=65):
-        if i - 65 < len(policy_base_effects_list):
-            base_effects = policy_base_effects_list[i - 65]
-            effects_str = ", ".join([f"{stat.title()}: {delta:+}" for stat, delta in base_effects.items()])
-            prompt += f" {chr(i)}. {opt_text} (Effects: {effects_str})\n"
-        else:
-            prompt += f" {chr(i)}. {opt_text} (Effects: Not available)\n"
-
-    prompt += (
-        f"\nConsider these options and their actual base effects. The Ruler can choose to allocate resources or focus across these policies.\n"
-        f"Advise on how resources should be distributed or which policies should be prioritized.\n"
-        f"You should suggest a specific allocation (e.g., 50% to A, 30% to B, 20% to C), or argue for prioritizing certain options.\n"
-        f"\nKingdom state: {state_dict}\n"
-        f"Previous messages: {thread}\n\n"
-        f"Speak directly and concisely (max 100 words). You may choose to remain silent (respond with '...'). Anything you say will be visible to all advisors and the ruler.\n"
-    )
-    
+    response = None
     try:
         # Use synchronous call to avoid async issues
-        response = model.generate_content(prompt, generation_config={"temperature": 0.7})
-        return response.text.strip()
+        response = model.generate_content(plan.prompt, generation_config=plan.generation_config)
+        reply = response.text.strip()
     except Exception as e:
+        # The call may have come back without a text part, in which case its usage is still known
+        governor.record_failure(plan, getattr(response, "usage_metadata", None))
         return f"Error generating response: {str(e)}"
+    else:
+        governor.record(plan, reply, getattr(response, "usage_metadata", None))
+        return reply
 
 def get_advisor_advice():
     """Get advice from all advisors"""
@@ -168,9 +157,10 @@ def get_advisor_advice():
                 st.session_state.current_crisis,
                 st.session_state.current_options,
                 str(st.session_state.game_state.to_dict()),  # Convert to string for caching
-                str(st.session_state.thread),  # Convert to string for caching
+                st.session_state.thread,  # Passed as a list so the budget governor can trim it
                 st.session_state.current_policy_effects,
-                api_key
+                api_key,
+                st.session_state.budget
             )
             
             if response != "...":
@@ -193,9 +183,10 @@ def ask_specific_advisor(advisor_name, message):
                 st.session_state.current_crisis,
                 st.session_state.current_options,
                 str(st.session_state.game_state.to_dict()),
-                str(st.session_state.thread),
+                st.session_state.thread,
                 st.session_state.current_policy_effects,
-                api_key
+                api_key,
+                st.session_state.budget
             )
             st.session_state.advice_received.append((advisor.name, reply))
             st.session_state.thread.append(f"{advisor.name}: {reply}")
@@ -214,9 +205,10 @@ def ask_all_advisors(message):
             st.session_state.current_crisis,
             st.session_state.current_options,
             str(st.session_state.game_state.to_dict()),
-            str(st.session_state.thread),
+            st.session_state.thread,
             st.session_state.current_policy_effects,
-            api_key
+            api_key,
+            st.session_state.budget
         )
         if reply != "...":
             st.session_state.advice_received.append((advisor.name, reply))
@@ -304,6 +296,18 @@ def main():
                 st.session_state.policy_executed = False
                 st.rerun()
         
+        # Advisor token budget
+        st.subheader("🪙 Advisor Budget")
+        budget = st.session_state.budget
+        st.progress(min(1.0, budget.session.used / budget.session.limit))
+        window = f"last {budget.session.window_seconds // 60} min"
+        st.caption(f"Session ({window}): {budget.session.used:,}/{budget.session.limit:,} tokens (~${budget.session.cost:.4f})")
+        st.caption(f"All reigns ({window}): {budget.process.used:,}/{budget.process.limit:,} tokens (~${budget.process.cost:.4f})")
+        # Worked out from current usage, so it agrees with the progress bar once old spend expires
+        stage = budget.stage_for(0)
+        if stage != STAGE_FULL:
+            st.warning(f"⚠️ {STAGE_LABELS[stage]}")
+        
         # Reset game button at bottom
         if st.button("🔄 Reset Game"):
             for key in list(st.session_state.keys()):